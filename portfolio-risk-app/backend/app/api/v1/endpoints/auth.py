@@ -17,7 +17,7 @@ from app.schemas.auth import (
 )
 from app.services.otp_service import otp_service
 from app.services.totp_service import two_factor_auth_service
-from app.services.simple_rate_limiter import rate_limiter
+from app.services import auth_rate_limiter
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -63,7 +63,7 @@ async def register_step1(
         ip_address = get_client_ip(request)
 
         # Rate limiting check
-        rate_check = rate_limiter.check_rate_limit(
+        rate_check = auth_rate_limiter.check_rate_limit(
             db, "registration", ip_address,
             settings.RATE_LIMIT_REGISTRATION_PER_DAY, 24 * 60
         )
@@ -179,7 +179,7 @@ async def verify_email(
         ip_address = get_client_ip(request)
 
         # Rate limiting
-        rate_check = rate_limiter.check_rate_limit(
+        rate_check = auth_rate_limiter.check_rate_limit(
             db, f"email_verification_{verification_data.user_id}", ip_address,
             settings.MAX_OTP_ATTEMPTS * 2, 60
         )
@@ -259,7 +259,7 @@ async def verify_phone(
         ip_address = get_client_ip(request)
 
         # Rate limiting
-        rate_check = rate_limiter.check_rate_limit(
+        rate_check = auth_rate_limiter.check_rate_limit(
             db, f"phone_verification_{verification_data.user_id}", ip_address,
             settings.MAX_OTP_ATTEMPTS * 2, 60
         )
@@ -413,7 +413,7 @@ async def verify_totp(
         ip_address = get_client_ip(request)
 
         # Rate limiting
-        rate_check = rate_limiter.check_rate_limit(
+        rate_check = auth_rate_limiter.check_rate_limit(
             db, f"totp_verification_{totp_request.user_id}", ip_address,
             settings.MAX_OTP_ATTEMPTS * 2, 60
         )
@@ -499,7 +499,7 @@ async def login(
         ip_address = get_client_ip(request)
 
         # Rate limiting
-        rate_check = rate_limiter.check_rate_limit(
+        rate_check = auth_rate_limiter.check_rate_limit(
             db, f"login_{login_data.username}", ip_address,
             settings.RATE_LIMIT_LOGIN_PER_HOUR, 60
         )
@@ -683,7 +683,7 @@ async def request_otp(
         limit_key = f"otp_{otp_request.method}_{otp_request.user_id}"
         rate_limit = settings.RATE_LIMIT_OTP_EMAIL_PER_HOUR if otp_request.method == "email" else settings.RATE_LIMIT_OTP_SMS_PER_HOUR
 
-        rate_check = rate_limiter.check_rate_limit(db, limit_key, ip_address, rate_limit, 60)
+        rate_check = auth_rate_limiter.check_rate_limit(db, limit_key, ip_address, rate_limit, 60)
         if not rate_check.allowed:
             return VerificationResponse(
                 success=False,
@@ -0,0 +1,21 @@
+from typing import Optional
+import redis
+
+from app.core.config import settings
+
+_redis_client: Optional[redis.Redis] = None
+
+def get_redis() -> redis.Redis:
+    """
+    Shared Redis client for ephemeral state (cooldowns, short-lived caches)
+    Connections are opened lazily on the first command
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5
+        )
+    return _redis_client
@@ -1,12 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import logging
 
 from app.core.config import settings
 from app.api.routes import auth, assessment, portfolio, users
 from app.api.v1.api import api_router as api_v1_router
 from app.core.database import engine, Base
+from app.services.rate_limiter import rate_limit_cleanup_job
+from app.services.sms_service import sms_service
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,7 +18,12 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     logger.info("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    cleanup_task = asyncio.create_task(rate_limit_cleanup_job())
     yield
+    cleanup_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await cleanup_task
+    await sms_service.aclose()
     logger.info("Application shutdown")
 
 app = FastAPI(
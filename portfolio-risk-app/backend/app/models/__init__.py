@@ -3,7 +3,7 @@ from app.models.assessment import Assessment, Portfolio
 from app.models.auth import (
     VerificationCode, VerificationCodeType,
     UserAuthMethod, AuthProvider,
-    AuthAttempt, RateLimitEntry
+    AuthAttempt, RateLimitEntry, SlidingWindowCounter
 )
 
 __all__ = [
@@ -11,5 +11,5 @@ __all__ = [
     "Assessment", "Portfolio",
     "VerificationCode", "VerificationCodeType",
     "UserAuthMethod", "AuthProvider",
-    "AuthAttempt", "RateLimitEntry"
+    "AuthAttempt", "RateLimitEntry", "SlidingWindowCounter"
 ]
\ No newline at end of file
@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Index, ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
 import enum
 from app.core.database import Base
@@ -142,46 +142,38 @@ class AuthAttempt(Base):
 
 class RateLimitEntry(Base):
     """
-    Rate limiting system for various operations
-    In-memory cache in production (Redis), DB for persistence
+    Event log for rate limiting (one row per recorded event, e.g. failures)
+    Queried by (key, identifier) over a trailing time window
     """
-    __tablename__ = "rate_limits"
+    __tablename__ = "rate_limit_entries"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
-    # Rate limit key (IP, user_id, email, phone, etc.)
-    limit_key = Column(String(255), nullable=False, unique=True)
-    limit_type = Column(String(50), nullable=False)  # login, otp_email, otp_sms
-
-    # Counters
-    attempts = Column(Integer, default=0)
-    max_attempts = Column(Integer, nullable=False)
+    # Rate limit key (login_failure, otp_email, ...) and client identifier (IP, user_id, ...)
+    key = Column(String(255), nullable=False)
+    identifier = Column(String(255), nullable=False)
 
     # Timing
-    window_start = Column(DateTime, default=datetime.utcnow)
-    window_duration = Column(Integer, nullable=False)  # seconds
-    blocked_until = Column(DateTime, nullable=True)
-
-    # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    # Indexes for fast lookups
+    # Indexes for fast lookups: every window query is key + identifier + time range,
+    # cleanup only filters on time
     __table_args__ = (
-        Index('idx_rate_limit_key', 'limit_key'),
-        Index('idx_rate_limit_type', 'limit_type'),
-        Index('idx_rate_limit_blocked', 'blocked_until'),
+        Index('idx_rate_limit_key_ident_ts', 'key', 'identifier', 'timestamp'),
+        Index('idx_rate_limit_timestamp', 'timestamp'),
     )
 
-    def is_blocked(self):
-        """Check if currently rate limited"""
-        if self.blocked_until and self.blocked_until > datetime.utcnow():
-            return True
-        return False
-
-    def reset_if_expired(self):
-        """Reset counter if window expired"""
-        if datetime.utcnow() - self.window_start > timedelta(seconds=self.window_duration):
-            self.attempts = 0
-            self.window_start = datetime.utcnow()
-            self.blocked_until = None
\ No newline at end of file
+class SlidingWindowCounter(Base):
+    """
+    Approximate sliding-window rate limit state
+    One row per (key, identifier): request counts for the current and the
+    previous fixed window, weighted together at check time
+    """
+    __tablename__ = "rate_limit_counters"
+
+    key = Column(String(255), primary_key=True)  # login, registration, otp_email, ...
+    identifier = Column(String(255), primary_key=True)  # IP, user_id, email, ...
+
+    window_start = Column(DateTime, nullable=False)  # start of the current fixed window
+    curr = Column(Integer, default=0, nullable=False)
+    prev = Column(Integer, default=0, nullable=False)
\ No newline at end of file
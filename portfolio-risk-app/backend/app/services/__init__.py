@@ -0,0 +1,13 @@
+from app.core.config import settings
+
+# Shared Redis state keeps limits consistent across workers; the in-memory
+# limiter is only accurate for a single process, so deployments with
+# Redis opt in through RATE_LIMIT_USE_REDIS. Named apart from the
+# app.services.rate_limiter submodule, which would shadow it once imported
+if settings.RATE_LIMIT_USE_REDIS:
+    from app.services.redis_rate_limiter import RedisRateLimiter
+    auth_rate_limiter = RedisRateLimiter()
+else:
+    from app.services.simple_rate_limiter import rate_limiter as auth_rate_limiter
+
+__all__ = ["auth_rate_limiter"]
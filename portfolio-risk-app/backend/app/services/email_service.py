@@ -1,19 +1,112 @@
 import smtplib
 import ssl
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email.header import Header
+from html.parser import HTMLParser
 from jinja2 import Template
 from premailer import transform
-from typing import Optional
+from typing import Optional, Tuple
 import logging
 from datetime import datetime, timedelta
 import asyncio
+import base64
+import re
 import aiosmtplib
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+_VERIFICATION_CODE_RE = re.compile(r'\b\d{6}\b')
+
+# %-style so formatting is deferred to the logging framework
+_DEV_EMAIL_LOG_TEMPLATE = """
+╔═══════════════════════════════════════════════════════════════╗
+║              📧 DEVELOPMENT MODE - EMAIL LOG                  ║
+╠═══════════════════════════════════════════════════════════════╣
+║ To: %-56s ║
+║ Subject: %-53s ║
+║                                                               ║
+║ 🔑 VERIFICATION CODE: %-40s ║
+║                                                               ║
+║ Full Content:                                                 ║
+║ %-61s ║
+╚═══════════════════════════════════════════════════════════════╝
+                """
+
+# Fixed two-part text+html layout; bodies are base64 so long HTML lines
+# never exceed the SMTP line limit and the boundary can't collide
+_MESSAGE_TEMPLATE = (
+    b"From: %b\r\n"
+    b"To: %b\r\n"
+    b"Subject: %b\r\n"
+    b"MIME-Version: 1.0\r\n"
+    b"Content-Type: multipart/alternative; boundary=\"=_portfoliorisk_alt\"\r\n"
+    b"\r\n"
+    b"--=_portfoliorisk_alt\r\n"
+    b"Content-Type: text/plain; charset=\"utf-8\"\r\n"
+    b"Content-Transfer-Encoding: base64\r\n"
+    b"\r\n"
+    b"%b"
+    b"--=_portfoliorisk_alt\r\n"
+    b"Content-Type: text/html; charset=\"utf-8\"\r\n"
+    b"Content-Transfer-Encoding: base64\r\n"
+    b"\r\n"
+    b"%b"
+    b"--=_portfoliorisk_alt--\r\n"
+)
+
+# Single-part layout for text-only sends such as email-to-SMS gateways
+_TEXT_MESSAGE_TEMPLATE = (
+    b"From: %b\r\n"
+    b"To: %b\r\n"
+    b"Subject: %b\r\n"
+    b"MIME-Version: 1.0\r\n"
+    b"Content-Type: text/plain; charset=\"utf-8\"\r\n"
+    b"Content-Transfer-Encoding: base64\r\n"
+    b"\r\n"
+    b"%b"
+)
+
+def _smtp_address(address: str) -> str:
+    """
+    ASCII form of an address for headers and the SMTP envelope
+    IDN domains are punycoded; a non-ASCII local part would need SMTPUTF8,
+    which we don't negotiate, so it raises ValueError
+    """
+    if address.isascii():
+        return address
+    local, _, domain = address.rpartition('@')
+    if not local.isascii():
+        raise ValueError("non-ASCII local part requires SMTPUTF8, which is not supported")
+    return f"{local}@{domain.encode('idna').decode('ascii')}"
+
+def _b64_body(content: str) -> bytes:
+    return base64.encodebytes(content.encode('utf-8')).replace(b"\n", b"\r\n")
+
+class _TextExtractor(HTMLParser):
+    """
+    Collects text nodes in a single pass, skipping style/script bodies
+    """
+
+    _SKIP_TAGS = {'style', 'script', 'head'}
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.chunks.append(data)
+
 class EmailService:
     """
     Scalable email service supporting multiple providers
@@ -29,11 +122,27 @@ class EmailService:
         self.from_email = settings.EMAIL_FROM
         self.is_development = settings.ENVIRONMENT == "development"
 
+    @property
+    def use_development_mode(self) -> bool:
+        """
+        Log emails instead of sending them (development or no SMTP credentials)
+        """
+        return self.is_development or not self.smtp_username or not self.smtp_password
+
+    @property
+    def is_configured(self) -> bool:
+        """
+        Whether a send can succeed at all, checked before doing any DB work
+        """
+        return settings.EMAIL_ENABLED and (
+            self.use_development_mode or bool(self.smtp_server)
+        )
+
     async def send_email_async(
         self,
         to_email: str,
         subject: str,
-        html_content: str,
+        html_content: Optional[str],
         text_content: Optional[str] = None
     ) -> bool:
         """
@@ -41,61 +150,41 @@ class EmailService:
         """
         try:
             # Check if we should use development mode (log emails instead of sending)
-            use_development_mode = (
-                self.is_development or
-                not self.smtp_username or
-                not self.smtp_password or
-                self.smtp_username == "" or
-                self.smtp_password == ""
-            )
-
-            if use_development_mode:
-                if not text_content:
+            if self.use_development_mode:
+                # The code is rendered into the HTML as well, so scan that
+                # directly and only fall back to HTML->text when it's missing
+                code_match = _VERIFICATION_CODE_RE.search(text_content or html_content)
+                if not code_match and not text_content:
                     text_content = self._html_to_text(html_content)
-
-                # Extract verification code from content if present
-                import re
-                code_match = re.search(r'\b\d{6}\b', text_content)
+                    code_match = _VERIFICATION_CODE_RE.search(text_content)
                 verification_code = code_match.group(0) if code_match else "N/A"
 
-                logger.warning(f"""
-╔═══════════════════════════════════════════════════════════════╗
-║              📧 DEVELOPMENT MODE - EMAIL LOG                  ║
-╠═══════════════════════════════════════════════════════════════╣
-║ To: {to_email:<56} ║
-║ Subject: {subject:<53} ║
-║                                                               ║
-║ 🔑 VERIFICATION CODE: {verification_code:<40} ║
-║                                                               ║
-║ Full Content:                                                 ║
-║ {text_content[:100]:<61} ║
-╚═══════════════════════════════════════════════════════════════╝
-                """)
+                if logger.isEnabledFor(logging.WARNING):
+                    logger.warning(
+                        _DEV_EMAIL_LOG_TEMPLATE,
+                        to_email,
+                        subject,
+                        verification_code,
+                        text_content[:100] if text_content else "(HTML only)"
+                    )
 
                 # Also print to console for visibility
                 print(f"\n⚡ VERIFICATION CODE for {to_email}: {verification_code}\n")
 
                 return True
 
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = self.from_email
-            message["To"] = to_email
-
-            # Create text part if not provided
-            if not text_content:
-                text_content = self._html_to_text(html_content)
-
-            # Add both text and HTML parts
-            text_part = MIMEText(text_content, "plain")
-            html_part = MIMEText(html_content, "html")
-
-            message.attach(text_part)
-            message.attach(html_part)
+            prepared = self._prepare_message(
+                to_email, subject, html_content, text_content
+            )
+            if prepared is None:
+                return False
+            sender, recipient, message = prepared
 
             # Send via async SMTP
             await aiosmtplib.send(
                 message,
+                sender=sender,
+                recipients=[recipient],
                 hostname=self.smtp_server,
                 port=self.smtp_port,
                 username=self.smtp_username,
@@ -114,26 +203,19 @@ class EmailService:
         self,
         to_email: str,
         subject: str,
-        html_content: str,
+        html_content: Optional[str],
         text_content: Optional[str] = None
     ) -> bool:
         """
         Synchronous email sending (fallback)
         """
         try:
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = self.from_email
-            message["To"] = to_email
-
-            if not text_content:
-                text_content = self._html_to_text(html_content)
-
-            text_part = MIMEText(text_content, "plain")
-            html_part = MIMEText(html_content, "html")
-
-            message.attach(text_part)
-            message.attach(html_part)
+            prepared = self._prepare_message(
+                to_email, subject, html_content, text_content
+            )
+            if prepared is None:
+                return False
+            sender, recipient, message = prepared
 
             # Create secure SSL context
             context = ssl.create_default_context()
@@ -141,7 +223,7 @@ class EmailService:
             with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
                 server.starttls(context=context)
                 server.login(self.smtp_username, self.smtp_password)
-                server.send_message(message)
+                server.sendmail(sender, [recipient], message)
 
             logger.info(f"Email sent successfully to {to_email}")
             return True
@@ -150,16 +232,73 @@ class EmailService:
             logger.error(f"Failed to send email to {to_email}: {str(e)}")
             return False
 
+    def _prepare_message(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: Optional[str],
+        text_content: Optional[str] = None
+    ) -> Optional[Tuple[str, str, bytes]]:
+        """
+        Convert the envelope addresses and render the message
+        Returns: (sender, recipient, message), or None for an unsupported address
+        """
+        try:
+            sender, recipient = _smtp_address(self.from_email), _smtp_address(to_email)
+        except ValueError as e:
+            logger.error(f"Unsupported email address for {to_email}: {e}")
+            return None
+
+        message = self._build_message(
+            sender, recipient, subject, html_content, text_content
+        )
+        return sender, recipient, message
+
+    def _build_message(
+        self,
+        from_email: str,
+        to_email: str,
+        subject: str,
+        html_content: Optional[str],
+        text_content: Optional[str] = None
+    ) -> bytes:
+        """
+        Render a multipart/alternative message straight to wire bytes
+        Without html_content only a text/plain part is sent
+        Addresses must already be ASCII (see _smtp_address)
+        """
+        if not subject.isascii():
+            # Folded continuation lines must use CRLF like the rest of the message
+            subject = Header(subject, 'utf-8').encode(linesep='\r\n')
+
+        if html_content is None:
+            return _TEXT_MESSAGE_TEMPLATE % (
+                from_email.encode('ascii'),
+                to_email.encode('ascii'),
+                subject.encode('ascii'),
+                _b64_body(text_content)
+            )
+
+        if not text_content:
+            text_content = self._html_to_text(html_content)
+
+        return _MESSAGE_TEMPLATE % (
+            from_email.encode('ascii'),
+            to_email.encode('ascii'),
+            subject.encode('ascii'),
+            _b64_body(text_content),
+            _b64_body(html_content)
+        )
+
     def _html_to_text(self, html_content: str) -> str:
         """
         Convert HTML to plain text (simple fallback)
         """
-        import re
-        # Remove HTML tags
-        text = re.sub(r'<[^>]+>', '', html_content)
+        parser = _TextExtractor()
+        parser.feed(html_content)
+        parser.close()
         # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+        return ' '.join(' '.join(parser.chunks).split())
 
 class EmailTemplateService:
     """
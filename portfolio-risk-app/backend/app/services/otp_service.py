@@ -1,11 +1,17 @@
-import secrets
+import os
 import hashlib
+import json
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 import logging
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
 
 from app.core.config import settings
+from app.core.cache import get_redis
 from app.models.auth import VerificationCode, VerificationCodeType
 from app.models.user import User
 from app.services.email_service import email_service, email_template_service
@@ -14,6 +20,31 @@ from app.core.security import get_password_hash, verify_password
 
 logger = logging.getLogger(__name__)
 
+# Randomness for OTP generation is pulled from os.urandom in 4KB blocks so
+# bulk code generation costs one syscall per block instead of one per digit
+_RNG_BUFFER_SIZE = 4096
+_rng_buffer = b""
+_rng_pos = _RNG_BUFFER_SIZE
+_rng_lock = threading.Lock()
+
+def _draw_random_bytes(n: int) -> bytes:
+    global _rng_buffer, _rng_pos
+    with _rng_lock:
+        if _rng_pos + n > _RNG_BUFFER_SIZE:
+            _rng_buffer = os.urandom(_RNG_BUFFER_SIZE)
+            _rng_pos = 0
+        chunk = _rng_buffer[_rng_pos:_rng_pos + n]
+        _rng_pos += n
+        return chunk
+
+def _reset_rng_buffer():
+    # Forked workers must never reuse the parent's buffered bytes
+    global _rng_buffer, _rng_pos
+    _rng_buffer = b""
+    _rng_pos = _RNG_BUFFER_SIZE
+
+os.register_at_fork(after_in_child=_reset_rng_buffer)
+
 class OTPService:
     """
     One-Time Password service for email and SMS verification
@@ -24,14 +55,24 @@ class OTPService:
         self.code_length = settings.OTP_LENGTH
         self.expiry_minutes = settings.OTP_EXPIRY_MINUTES
         self.max_attempts = settings.MAX_OTP_ATTEMPTS
+        self.resend_cooldown_minutes = 1
+        self.status_cache_ttl_seconds = 1
+        self.status_cache_max_entries = 10000
+        self._status_cache = {}  # cache_key -> (expires_monotonic, snapshot)
 
     def generate_code(self) -> str:
         """
         Generate cryptographically secure OTP code
         """
-        # Generate random digits
-        code = ''.join([str(secrets.randbelow(10)) for _ in range(self.code_length)])
-        return code
+        modulus = 10 ** self.code_length
+        num_bytes = (modulus.bit_length() + 7) // 8
+        # Reject the top partial range so every code stays equally likely
+        limit = (1 << (8 * num_bytes)) // modulus * modulus
+
+        while True:
+            value = int.from_bytes(_draw_random_bytes(num_bytes), 'big')
+            if value < limit:
+                return f"{value % modulus:0{self.code_length}d}"
 
     def hash_code(self, code: str) -> str:
         """
@@ -52,23 +93,17 @@ class OTPService:
     ) -> bool:
         """
         Send email verification code
+        The verification record is only written once the email went out
         """
+        if not email_service.is_configured:
+            logger.error("Email sending is not configured")
+            return False
+
         try:
             # Generate new verification code
             code = self.generate_code()
             hashed_code = self.hash_code(code)
-
-            # Create verification record
-            verification = VerificationCode(
-                user_id=user.id,
-                code_hash=hashed_code,
-                code_type=VerificationCodeType.EMAIL_VERIFICATION,
-                recipient=user.email,
-                expires_at=datetime.utcnow() + timedelta(minutes=self.expiry_minutes)
-            )
-
-            db.add(verification)
-            db.commit()
+            expires_at = datetime.utcnow() + timedelta(minutes=self.expiry_minutes)
 
             # Send email
             html_content, subject = email_template_service.render_verification_email(
@@ -84,11 +119,16 @@ class OTPService:
             )
 
             if success:
-                logger.info(f"Email verification sent to {user.email}")
-            else:
-                # Remove verification record if email failed
-                db.delete(verification)
+                db.add(VerificationCode(
+                    user_id=user.id,
+                    code_hash=hashed_code,
+                    code_type=VerificationCodeType.EMAIL_VERIFICATION,
+                    recipient=user.email,
+                    expires_at=expires_at
+                ))
                 db.commit()
+                self._start_cooldown(user.id, VerificationCodeType.EMAIL_VERIFICATION)
+                logger.info(f"Email verification sent to {user.email}")
 
             return success
 
@@ -96,6 +136,8 @@ class OTPService:
             logger.error(f"Failed to send email verification: {e}")
             db.rollback()
             return False
+        finally:
+            self._invalidate_status(user.id, VerificationCodeType.EMAIL_VERIFICATION)
 
     async def send_phone_verification(
         self,
@@ -113,18 +155,7 @@ class OTPService:
             # Generate new verification code
             code = self.generate_code()
             hashed_code = self.hash_code(code)
-
-            # Create verification record
-            verification = VerificationCode(
-                user_id=user.id,
-                code_hash=hashed_code,
-                code_type=VerificationCodeType.PHONE_VERIFICATION,
-                recipient=user.phone_number,
-                expires_at=datetime.utcnow() + timedelta(minutes=self.expiry_minutes)
-            )
-
-            db.add(verification)
-            db.commit()
+            expires_at = datetime.utcnow() + timedelta(minutes=self.expiry_minutes)
 
             # Send SMS
             message = sms_template_service.format_verification_code(code)
@@ -135,11 +166,16 @@ class OTPService:
             )
 
             if success:
-                logger.info(f"SMS verification sent to {user.phone_number}")
-            else:
-                # Remove verification record if SMS failed
-                db.delete(verification)
+                db.add(VerificationCode(
+                    user_id=user.id,
+                    code_hash=hashed_code,
+                    code_type=VerificationCodeType.PHONE_VERIFICATION,
+                    recipient=user.phone_number,
+                    expires_at=expires_at
+                ))
                 db.commit()
+                self._start_cooldown(user.id, VerificationCodeType.PHONE_VERIFICATION)
+                logger.info(f"SMS verification sent to {user.phone_number}")
 
             return success
 
@@ -147,6 +183,8 @@ class OTPService:
             logger.error(f"Failed to send SMS verification: {e}")
             db.rollback()
             return False
+        finally:
+            self._invalidate_status(user.id, VerificationCodeType.PHONE_VERIFICATION)
 
     async def send_login_otp(
         self,
@@ -172,20 +210,14 @@ class OTPService:
                 code_type = VerificationCodeType.LOGIN_OTP
                 method = "email"
 
-            # Create verification record
-            verification = VerificationCode(
-                user_id=user.id,
-                code_hash=hashed_code,
-                code_type=code_type,
-                recipient=recipient,
-                expires_at=datetime.utcnow() + timedelta(minutes=self.expiry_minutes)
-            )
-
-            db.add(verification)
-            db.commit()
+            expires_at = datetime.utcnow() + timedelta(minutes=self.expiry_minutes)
 
             # Send based on method
             if method == "email":
+                if not email_service.is_configured:
+                    logger.error("Email sending is not configured")
+                    return False
+
                 html_content, subject = email_template_service.render_login_otp_email(
                     user_name=user.full_name or user.username,
                     otp_code=code,
@@ -205,10 +237,16 @@ class OTPService:
                 )
 
             if success:
-                logger.info(f"Login OTP sent via {method} to user {user.id}")
-            else:
-                db.delete(verification)
+                db.add(VerificationCode(
+                    user_id=user.id,
+                    code_hash=hashed_code,
+                    code_type=code_type,
+                    recipient=recipient,
+                    expires_at=expires_at
+                ))
                 db.commit()
+                self._start_cooldown(user.id, code_type)
+                logger.info(f"Login OTP sent via {method} to user {user.id}")
 
             return success
 
@@ -216,6 +254,8 @@ class OTPService:
             logger.error(f"Failed to send login OTP: {e}")
             db.rollback()
             return False
+        finally:
+            self._invalidate_status(user.id, VerificationCodeType.LOGIN_OTP)
 
     def verify_verification_code(
         self,
@@ -229,10 +269,12 @@ class OTPService:
         Returns: (success, message)
         """
         try:
-            # Find the most recent valid code
-            verification = (
-                db.query(VerificationCode)
-                .filter(
+            # Lock the most recent valid code and count the attempt in one
+            # statement; a concurrent verify waits on the row lock and then
+            # re-checks the newest code instead of falling back to an older one
+            latest_code_id = (
+                select(VerificationCode.id)
+                .where(
                     VerificationCode.user_id == user_id,
                     VerificationCode.code_type == code_type,
                     VerificationCode.is_used == False,
@@ -240,21 +282,28 @@ class OTPService:
                     VerificationCode.expires_at > datetime.utcnow()
                 )
                 .order_by(VerificationCode.created_at.desc())
-                .first()
+                .limit(1)
+                .with_for_update()
+                .scalar_subquery()
             )
 
+            verification = db.scalars(
+                update(VerificationCode)
+                .where(VerificationCode.id == latest_code_id)
+                .values(attempts=VerificationCode.attempts + 1)
+                .returning(VerificationCode)
+            ).first()
+
             if not verification:
+                db.rollback()
                 return False, "No valid verification code found"
 
-            # Check if too many attempts
-            if verification.attempts >= verification.max_attempts:
+            # Check if too many attempts (counting this one)
+            if verification.attempts > verification.max_attempts:
                 verification.is_expired = True
                 db.commit()
                 return False, "Too many failed attempts"
 
-            # Increment attempt count
-            verification.attempts += 1
-
             # Verify the code
             if self.verify_code(code, verification.code_hash):
                 # Mark as used
@@ -265,19 +314,22 @@ class OTPService:
                 logger.info(f"Code verified successfully for user {user_id}")
                 return True, "Code verified successfully"
             else:
-                db.commit()
                 attempts_left = verification.max_attempts - verification.attempts
+                if attempts_left <= 0:
+                    verification.is_expired = True
+                db.commit()
+
                 if attempts_left > 0:
                     return False, f"Invalid code. {attempts_left} attempts remaining"
                 else:
-                    verification.is_expired = True
-                    db.commit()
                     return False, "Invalid code. No attempts remaining"
 
         except Exception as e:
             logger.error(f"Error verifying code: {e}")
             db.rollback()
             return False, "Verification failed"
+        finally:
+            self._invalidate_status(user_id, code_type)
 
     def cleanup_expired_codes(self, db: Session) -> int:
         """
@@ -312,19 +364,25 @@ class OTPService:
     ) -> dict:
         """
         Get verification status for a user
+        Served from a 1-second cache so UI polling doesn't hit the DB;
+        time_remaining is always derived from expires_at at read time
         """
-        try:
-            verification = (
-                db.query(VerificationCode)
-                .filter(
-                    VerificationCode.user_id == user_id,
-                    VerificationCode.code_type == code_type
+        snapshot = self._get_cached_status(user_id, code_type)
+
+        if snapshot is None:
+            try:
+                verification = (
+                    db.query(VerificationCode)
+                    .filter(
+                        VerificationCode.user_id == user_id,
+                        VerificationCode.code_type == code_type
+                    )
+                    .order_by(VerificationCode.created_at.desc())
+                    .first()
                 )
-                .order_by(VerificationCode.created_at.desc())
-                .first()
-            )
 
-            if not verification:
+            except Exception as e:
+                logger.error(f"Error getting verification status: {e}")
                 return {
                     "has_code": False,
                     "is_expired": True,
@@ -332,21 +390,21 @@ class OTPService:
                     "time_remaining": 0
                 }
 
-            time_remaining = 0
-            if verification.expires_at > datetime.utcnow():
-                time_remaining = int((verification.expires_at - datetime.utcnow()).total_seconds())
+            if not verification:
+                snapshot = {"has_code": False}
+            else:
+                snapshot = {
+                    "has_code": True,
+                    "is_expired": bool(verification.is_expired),
+                    "is_used": verification.is_used,
+                    "attempts_remaining": max(0, verification.max_attempts - verification.attempts),
+                    "expires_at": verification.expires_at.isoformat(),
+                    "recipient": verification.recipient
+                }
 
-            return {
-                "has_code": True,
-                "is_expired": verification.is_expired or verification.expires_at <= datetime.utcnow(),
-                "is_used": verification.is_used,
-                "attempts_remaining": max(0, verification.max_attempts - verification.attempts),
-                "time_remaining": time_remaining,
-                "recipient": verification.recipient
-            }
+            self._cache_status(user_id, code_type, snapshot)
 
-        except Exception as e:
-            logger.error(f"Error getting verification status: {e}")
+        if not snapshot["has_code"]:
             return {
                 "has_code": False,
                 "is_expired": True,
@@ -354,17 +412,134 @@ class OTPService:
                 "time_remaining": 0
             }
 
+        now = datetime.utcnow()
+        expires_at = datetime.fromisoformat(snapshot["expires_at"])
+
+        time_remaining = 0
+        if expires_at > now:
+            time_remaining = int((expires_at - now).total_seconds())
+
+        return {
+            "has_code": True,
+            "is_expired": snapshot["is_expired"] or expires_at <= now,
+            "is_used": snapshot["is_used"],
+            "attempts_remaining": snapshot["attempts_remaining"],
+            "time_remaining": time_remaining,
+            "recipient": snapshot["recipient"]
+        }
+
+    def _status_cache_key(self, user_id: int, code_type: VerificationCodeType) -> str:
+        return f"vstatus:{user_id}:{code_type.value}"
+
+    def _get_cached_status(
+        self,
+        user_id: int,
+        code_type: VerificationCodeType
+    ) -> Optional[dict]:
+        """
+        Look up a status snapshot in-process first, then in Redis
+        """
+        cache_key = self._status_cache_key(user_id, code_type)
+
+        entry = self._status_cache.get(cache_key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        try:
+            cached = get_redis().get(cache_key)
+        except RedisError as e:
+            logger.debug(f"Redis status cache read failed: {e}")
+            return None
+
+        if cached is None:
+            return None
+
+        snapshot = json.loads(cached)
+        self._store_local_status(cache_key, snapshot)
+        return snapshot
+
+    def _cache_status(
+        self,
+        user_id: int,
+        code_type: VerificationCodeType,
+        snapshot: dict
+    ):
+        cache_key = self._status_cache_key(user_id, code_type)
+        self._store_local_status(cache_key, snapshot)
+
+        try:
+            get_redis().setex(cache_key, self.status_cache_ttl_seconds, json.dumps(snapshot))
+        except RedisError as e:
+            logger.debug(f"Redis status cache write failed: {e}")
+
+    def _store_local_status(self, cache_key: str, snapshot: dict):
+        # Entries only live for a second, so a full reset is a cheap bound
+        if len(self._status_cache) >= self.status_cache_max_entries:
+            self._status_cache.clear()
+        self._status_cache[cache_key] = (
+            time.monotonic() + self.status_cache_ttl_seconds,
+            snapshot
+        )
+
+    def _invalidate_status(self, user_id: int, code_type: VerificationCodeType):
+        """
+        Drop cached status after a code is issued or checked
+        """
+        cache_key = self._status_cache_key(user_id, code_type)
+        self._status_cache.pop(cache_key, None)
+
+        try:
+            get_redis().delete(cache_key)
+        except RedisError as e:
+            logger.debug(f"Redis status cache invalidation failed: {e}")
+
+    def _cooldown_key(self, user_id: int, code_type: VerificationCodeType) -> str:
+        return f"otp:cooldown:{user_id}:{code_type.value}"
+
+    def _start_cooldown(self, user_id: int, code_type: VerificationCodeType):
+        """
+        Start the resend cooldown once a code has actually been sent
+        """
+        try:
+            get_redis().set(
+                self._cooldown_key(user_id, code_type),
+                "1",
+                nx=True,
+                ex=self.resend_cooldown_minutes * 60
+            )
+        except RedisError as e:
+            logger.warning(f"Redis cooldown start failed: {e}")
+
     def can_request_new_code(
         self,
         db: Session,
         user_id: int,
         code_type: VerificationCodeType,
-        cooldown_minutes: int = 1
+        cooldown_minutes: Optional[int] = None
     ) -> Tuple[bool, int]:
         """
         Check if user can request a new verification code
+        Only reads the cooldown started by a successful send; the DB is only
+        consulted when Redis is unreachable
         Returns: (can_request, seconds_to_wait)
         """
+        if cooldown_minutes is None:
+            cooldown_minutes = self.resend_cooldown_minutes
+
+        try:
+            ttl = get_redis().ttl(self._cooldown_key(user_id, code_type))
+            if ttl <= 0:
+                return True, 0
+            # The key always lives resend_cooldown_minutes; rebase its age
+            # onto the requested cooldown
+            elapsed = self.resend_cooldown_minutes * 60 - ttl
+            remaining = cooldown_minutes * 60 - elapsed
+            if remaining <= 0:
+                return True, 0
+            return False, remaining
+        except RedisError as e:
+            logger.warning(f"Redis cooldown check failed, falling back to DB: {e}")
+
         try:
             last_verification = (
                 db.query(VerificationCode)
@@ -1,14 +1,26 @@
 from datetime import datetime, timedelta
 from typing import Optional, NamedTuple
+import asyncio
 import logging
+import math
+import time
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, case, delete, func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
 
-from app.models.auth import RateLimitEntry
+from app.models.auth import RateLimitEntry, SlidingWindowCounter
 from app.core.config import settings
+from app.core.database import SessionLocal
 
 logger = logging.getLogger(__name__)
 
+_EPOCH = datetime(1970, 1, 1)
+
+# Rate limit bookkeeping may lose its last few commits on a server crash;
+# skipping the WAL flush wait keeps commit latency off the auth hot path
+_ASYNC_COMMIT = text("SET LOCAL synchronous_commit TO OFF")
+
 class RateLimitResult(NamedTuple):
     allowed: bool
     retry_after: int = 0
@@ -16,12 +28,10 @@ class RateLimitResult(NamedTuple):
 class RateLimiterService:
     """
     Database-backed rate limiting service for authentication endpoints
-    Provides sliding window rate limiting with automatic cleanup
+    Approximate sliding window per (key, identifier): the previous fixed
+    window's count is weighted by its overlap with the trailing window
     """
 
-    def __init__(self):
-        self.cleanup_interval_minutes = 60  # Cleanup old entries every hour
-
     def check_rate_limit(
         self,
         db: Session,
@@ -44,68 +54,93 @@ class RateLimiterService:
             RateLimitResult with allowed status and retry_after seconds
         """
         try:
-            now = datetime.utcnow()
-            window_start = now - timedelta(minutes=window_minutes)
+            window_seconds = window_minutes * 60
+            window_start, elapsed = self._current_window(time.time(), window_seconds)
+            # Share of the previous window still inside the sliding window
+            prev_weight = 1 - elapsed / window_seconds
+
+            # Roll the stored windows forward to the current one; a row already in a
+            # later window (another worker crossed the boundary first, or its clock
+            # runs ahead) is treated as current and never moved back
+            counter = SlidingWindowCounter
+            in_current = counter.window_start >= window_start
+            in_previous = counter.window_start == window_start - timedelta(seconds=window_seconds)
+            prev = case((in_current, counter.prev), (in_previous, counter.curr), else_=0)
+            curr = case((in_current, counter.curr), else_=0)
+
+            db.execute(_ASYNC_COMMIT)
+
+            # Roll, estimate and count the request in one statement; the row
+            # is left untouched when the estimate is already at the limit
+            counted = db.execute(
+                pg_insert(counter)
+                .values(key=key, identifier=identifier, window_start=window_start, curr=1, prev=0)
+                .on_conflict_do_update(
+                    index_elements=[counter.key, counter.identifier],
+                    set_={
+                        'window_start': func.greatest(counter.window_start, window_start),
+                        'prev': prev,
+                        'curr': curr + 1
+                    },
+                    where=prev * prev_weight + curr < limit
+                )
+                .returning(counter.curr)
+            ).first()
+            db.commit()
+
+            if counted is not None:
+                return RateLimitResult(allowed=True, retry_after=0)
 
-            # Count existing entries within the time window
-            count = (
-                db.query(RateLimitEntry)
+            # Rate limit exceeded - work out when the estimate drops below the limit
+            stored = (
+                db.query(counter.window_start, counter.curr, counter.prev)
                 .filter(
                     and_(
-                        RateLimitEntry.key == key,
-                        RateLimitEntry.identifier == identifier,
-                        RateLimitEntry.timestamp >= window_start
+                        counter.key == key,
+                        counter.identifier == identifier
                     )
                 )
-                .count()
+                .one()
             )
-
-            if count >= limit:
-                # Rate limit exceeded - find the oldest entry to calculate retry time
-                oldest_entry = (
-                    db.query(RateLimitEntry)
-                    .filter(
-                        and_(
-                            RateLimitEntry.key == key,
-                            RateLimitEntry.identifier == identifier,
-                            RateLimitEntry.timestamp >= window_start
-                        )
-                    )
-                    .order_by(RateLimitEntry.timestamp.asc())
-                    .first()
-                )
-
-                if oldest_entry:
-                    # Calculate when the oldest entry will expire
-                    retry_time = oldest_entry.timestamp + timedelta(minutes=window_minutes)
-                    retry_after = max(0, int((retry_time - now).total_seconds()))
-                else:
-                    retry_after = window_minutes * 60  # Default to full window
-
-                logger.warning(f"Rate limit exceeded for {key}:{identifier} ({count}/{limit})")
-                return RateLimitResult(allowed=False, retry_after=retry_after)
-
-            # Rate limit check passed - record this request
-            rate_entry = RateLimitEntry(
-                key=key,
-                identifier=identifier,
-                timestamp=now
-            )
-
-            db.add(rate_entry)
-            db.commit()
-
-            # Optionally clean up old entries
-            self._cleanup_old_entries(db, now)
-
-            return RateLimitResult(allowed=True, retry_after=0)
-
-        except Exception as e:
+            prev_count, curr_count = self._roll_counts(stored, window_start, window_seconds)
+
+            if curr_count < limit and prev_count:
+                # The previous window's share decays away within this window
+                wait = window_seconds * (1 - (limit - curr_count) / prev_count) - elapsed
+            elif curr_count >= limit:
+                # Only once this window becomes the (decaying) previous one
+                wait = (window_seconds - elapsed) + window_seconds * (1 - limit / curr_count)
+            else:
+                # The row moved on since the upsert; the next request can just retry
+                wait = 0
+            retry_after = max(1, math.ceil(wait))
+
+            logger.warning(f"Rate limit exceeded for {key}:{identifier} ({limit}/{window_minutes}m)")
+            return RateLimitResult(allowed=False, retry_after=retry_after)
+
+        except SQLAlchemyError as e:
             logger.error(f"Rate limit check failed: {e}")
             db.rollback()
             # On error, allow the request but log the issue
             return RateLimitResult(allowed=True, retry_after=0)
 
+    def _current_window(self, now_ts: float, window_seconds: int) -> tuple[datetime, float]:
+        """
+        Start of the fixed window containing the epoch time `now_ts` and seconds elapsed in it
+        """
+        start_ts = int(now_ts) - int(now_ts) % window_seconds
+        return datetime.utcfromtimestamp(start_ts), now_ts - start_ts
+
+    def _roll_counts(self, stored, window_start: datetime, window_seconds: int) -> tuple[int, int]:
+        """
+        (prev, curr) counts of a stored row as seen from `window_start`
+        """
+        if stored.window_start >= window_start:
+            return stored.prev, stored.curr
+        if stored.window_start == window_start - timedelta(seconds=window_seconds):
+            return stored.curr, 0
+        return 0, 0
+
     def reset_rate_limit(
         self,
         db: Session,
@@ -117,19 +152,19 @@ class RateLimiterService:
         Useful for admin operations or successful authentication
         """
         try:
-            deleted_count = (
-                db.query(RateLimitEntry)
+            (
+                db.query(SlidingWindowCounter)
                 .filter(
                     and_(
-                        RateLimitEntry.key == key,
-                        RateLimitEntry.identifier == identifier
+                        SlidingWindowCounter.key == key,
+                        SlidingWindowCounter.identifier == identifier
                     )
                 )
                 .delete()
             )
 
             db.commit()
-            logger.info(f"Reset rate limit for {key}:{identifier} ({deleted_count} entries removed)")
+            logger.info(f"Reset rate limit for {key}:{identifier}")
             return True
 
         except Exception as e:
@@ -148,31 +183,34 @@ class RateLimiterService:
         Get current rate limit status without incrementing
         """
         try:
-            now = datetime.utcnow()
-            window_start = now - timedelta(minutes=window_minutes)
-
-            entries = (
-                db.query(RateLimitEntry)
+            window_seconds = window_minutes * 60
+            window_start, elapsed = self._current_window(time.time(), window_seconds)
+
+            stored = (
+                db.query(
+                    SlidingWindowCounter.window_start,
+                    SlidingWindowCounter.curr,
+                    SlidingWindowCounter.prev
+                )
                 .filter(
                     and_(
-                        RateLimitEntry.key == key,
-                        RateLimitEntry.identifier == identifier,
-                        RateLimitEntry.timestamp >= window_start
+                        SlidingWindowCounter.key == key,
+                        SlidingWindowCounter.identifier == identifier
                     )
                 )
-                .order_by(RateLimitEntry.timestamp.desc())
-                .all()
+                .first()
             )
 
-            count = len(entries)
-            last_request = entries[0].timestamp if entries else None
+            prev_count, curr_count = (
+                self._roll_counts(stored, window_start, window_seconds) if stored else (0, 0)
+            )
+            estimated = prev_count * (1 - elapsed / window_seconds) + curr_count
 
             return {
                 "key": key,
                 "identifier": identifier,
-                "current_count": count,
+                "current_count": math.ceil(estimated),
                 "window_minutes": window_minutes,
-                "last_request": last_request,
                 "window_start": window_start
             }
 
@@ -183,37 +221,60 @@ class RateLimiterService:
                 "identifier": identifier,
                 "current_count": 0,
                 "window_minutes": window_minutes,
-                "last_request": None,
                 "window_start": None,
                 "error": str(e)
             }
 
-    def _cleanup_old_entries(self, db: Session, current_time: datetime):
+    def cleanup_old_entries(self, db: Session, batch_size: int = 1000) -> int:
         """
-        Clean up rate limit entries older than the maximum window
-        This is called periodically to prevent the table from growing indefinitely
+        Delete stale rate limit rows in small batches, committing between them
+        Runs out-of-band (see rate_limit_cleanup_job) so no request ever
+        waits on a long DELETE; SKIP LOCKED avoids blocking live writers
+        Returns number of rows removed
         """
-        try:
-            # Only clean up occasionally to avoid overhead
-            if current_time.minute % self.cleanup_interval_minutes != 0:
-                return
-
-            # Clean up entries older than the longest possible window (24 hours for daily limits)
-            cleanup_threshold = current_time - timedelta(hours=25)
+        # Longest window in use is 24 hours (daily limits); a counter whose
+        # window started two windows ago no longer contributes anything
+        now = datetime.utcnow()
+        cleanup_threshold = now - timedelta(hours=25)
+        counter_threshold = now - timedelta(hours=49)
+        total_deleted = 0
 
-            deleted_count = (
-                db.query(RateLimitEntry)
-                .filter(RateLimitEntry.timestamp < cleanup_threshold)
-                .delete()
+        try:
+            batches = (
+                delete(RateLimitEntry).where(
+                    RateLimitEntry.id.in_(
+                        select(RateLimitEntry.id)
+                        .where(RateLimitEntry.timestamp < cleanup_threshold)
+                        .limit(batch_size)
+                        .with_for_update(skip_locked=True)
+                    )
+                ),
+                delete(SlidingWindowCounter).where(
+                    tuple_(SlidingWindowCounter.key, SlidingWindowCounter.identifier).in_(
+                        select(SlidingWindowCounter.key, SlidingWindowCounter.identifier)
+                        .where(SlidingWindowCounter.window_start < counter_threshold)
+                        .limit(batch_size)
+                        .with_for_update(skip_locked=True)
+                    )
+                )
             )
 
-            if deleted_count > 0:
-                db.commit()
-                logger.info(f"Cleaned up {deleted_count} old rate limit entries")
+            for stmt in batches:
+                while True:
+                    deleted_count = db.execute(stmt).rowcount
+                    db.commit()
+                    total_deleted += deleted_count
+                    if deleted_count < batch_size:
+                        break
+
+            if total_deleted > 0:
+                logger.info(f"Cleaned up {total_deleted} old rate limit rows")
+            return total_deleted
 
         except Exception as e:
             logger.error(f"Rate limit cleanup failed: {e}")
             db.rollback()
+            return total_deleted
 
     def get_rate_limit_config(self) -> dict:
         """
@@ -246,8 +307,9 @@ class AdvancedRateLimiter:
         """
         Check against multiple rate limit windows
         Example: [(5, 1), (20, 60)] = max 5 per minute, 20 per hour
+        Windows are checked shortest first, regardless of list order
         """
-        for limit, window_minutes in limits:
+        for limit, window_minutes in sorted(limits, key=lambda x: x[1]):
             result = self.base_limiter.check_rate_limit(
                 db, f"{key}_{window_minutes}m", identifier, limit, window_minutes
             )
@@ -283,19 +345,22 @@ class AdvancedRateLimiter:
         Implement progressive delay based on failure count
         Each failure increases the delay exponentially
         """
-        now = datetime.utcnow()
+        now_ts = time.time()
 
-        # Count recent failures
-        failure_count = (
-            db.query(RateLimitEntry)
+        # Count recent failures and find the latest one in a single query
+        failure_count, last_failure_at = (
+            db.query(
+                func.count(RateLimitEntry.id),
+                func.max(RateLimitEntry.timestamp)
+            )
             .filter(
                 and_(
                     RateLimitEntry.key == f"{key}_failure",
                     RateLimitEntry.identifier == identifier,
-                    RateLimitEntry.timestamp >= now - timedelta(hours=1)
+                    RateLimitEntry.timestamp >= datetime.utcfromtimestamp(now_ts - 3600)
                 )
             )
-            .count()
+            .one()
         )
 
         if failure_count == 0:
@@ -304,23 +369,11 @@ class AdvancedRateLimiter:
         # Progressive delay: 1min, 2min, 4min, 8min, max 30min
         delay_minutes = min(30, base_window_minutes * (2 ** (failure_count - 1)))
 
-        last_failure = (
-            db.query(RateLimitEntry)
-            .filter(
-                and_(
-                    RateLimitEntry.key == f"{key}_failure",
-                    RateLimitEntry.identifier == identifier
-                )
-            )
-            .order_by(RateLimitEntry.timestamp.desc())
-            .first()
-        )
-
-        if last_failure:
-            time_since_failure = now - last_failure.timestamp
-            if time_since_failure < timedelta(minutes=delay_minutes):
-                retry_after = int((timedelta(minutes=delay_minutes) - time_since_failure).total_seconds())
-                return RateLimitResult(allowed=False, retry_after=retry_after)
+        delay_seconds = delay_minutes * 60
+        time_since_failure = now_ts - (last_failure_at - _EPOCH).total_seconds()
+        if time_since_failure < delay_seconds:
+            retry_after = int(delay_seconds - time_since_failure)
+            return RateLimitResult(allowed=False, retry_after=retry_after)
 
         return RateLimitResult(allowed=True, retry_after=0)
 
@@ -339,6 +392,7 @@ class AdvancedRateLimiter:
                 identifier=identifier,
                 timestamp=datetime.utcnow()
             )
+            db.execute(_ASYNC_COMMIT)
             db.add(failure_entry)
             db.commit()
         except Exception as e:
@@ -347,4 +401,20 @@ class AdvancedRateLimiter:
 
 # Singleton instances
 rate_limiter = RateLimiterService()
-advanced_rate_limiter = AdvancedRateLimiter()
\ No newline at end of file
+advanced_rate_limiter = AdvancedRateLimiter()
+
+def _run_cleanup():
+    db = SessionLocal()
+    try:
+        rate_limiter.cleanup_old_entries(db)
+    finally:
+        db.close()
+
+async def rate_limit_cleanup_job(interval_minutes: int = 60):
+    """
+    Background task started from the app lifespan; runs the batched
+    cleanup off the event loop every `interval_minutes`
+    """
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        await asyncio.to_thread(_run_cleanup)
\ No newline at end of file
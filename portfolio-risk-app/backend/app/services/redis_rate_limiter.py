@@ -0,0 +1,76 @@
+import logging
+from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
+
+from app.core.cache import get_redis
+from app.services.simple_rate_limiter import RateLimitResult, SimpleRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Token bucket kept in a hash {t: tokens, l: last refill ms}. Refill, take and
+# expiry happen atomically in one round-trip; time comes from the Redis
+# server so every worker agrees on it
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 't', 'l')
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+
+if tokens < 1 then
+    return {0, math.ceil((1 - tokens) / rate / 1000)}
+end
+
+redis.call('HSET', KEYS[1], 't', tokens - 1, 'l', now)
+redis.call('PEXPIRE', KEYS[1], ttl)
+return {1, 0}
+"""
+
+class RedisRateLimiter:
+    """
+    Redis-backed token bucket rate limiter shared by all workers
+    Same interface as SimpleRateLimiter; falls back to it while Redis is unreachable
+    """
+
+    def __init__(self):
+        self._script = get_redis().register_script(_TOKEN_BUCKET_SCRIPT)
+        self._fallback = SimpleRateLimiter()
+
+    def _bucket_key(self, key: str, identifier: str) -> str:
+        return f"ratelimit:{key}:{identifier}"
+
+    def check_rate_limit(
+        self,
+        db: Session,
+        key: str,
+        identifier: str,
+        limit: int,
+        window_minutes: int
+    ) -> RateLimitResult:
+        """Token bucket check, one EVALSHA per call"""
+        window_ms = window_minutes * 60 * 1000
+        try:
+            allowed, retry_after = self._script(
+                keys=[self._bucket_key(key, identifier)],
+                args=[limit, limit / window_ms, window_ms]
+            )
+            return RateLimitResult(allowed=bool(allowed), retry_after=int(retry_after))
+
+        except RedisError as e:
+            logger.warning(f"Redis rate limit check failed, using in-memory limiter: {e}")
+            return self._fallback.check_rate_limit(db, key, identifier, limit, window_minutes)
+
+    def reset_rate_limit(self, db: Session, key: str, identifier: str) -> bool:
+        """Reset rate limit for a key"""
+        self._fallback.reset_rate_limit(db, key, identifier)
+        try:
+            get_redis().delete(self._bucket_key(key, identifier))
+            return True
+        except RedisError as e:
+            logger.error(f"Failed to reset rate limit: {e}")
+            return False
@@ -1,10 +1,15 @@
-from datetime import datetime, timedelta
 from typing import NamedTuple
 import logging
+import math
+import threading
+import time
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
 
+_LOCK_STRIPES = 64  # power of two, so a stripe is picked with a bit mask
+
 class RateLimitResult(NamedTuple):
     allowed: bool
     retry_after: int = 0
@@ -15,8 +20,15 @@ class SimpleRateLimiter:
     For production, use Redis-based rate limiting
     """
 
-    def __init__(self):
-        self._counters = {}  # Simple in-memory storage
+    def __init__(self, max_entries: int = 100_000, max_window_minutes: int = 24 * 60):
+        # limit_key -> (tokens, last_refill monotonic seconds); identifiers
+        # idle for longer than the longest window expire automatically
+        self._counters = TTLCache(maxsize=max_entries, ttl=max_window_minutes * 60)
+        # Striped per-key locks make each read-modify-write atomic without
+        # serializing unrelated identifiers; TTLCache itself is not
+        # thread-safe, so its (very short) get/set calls share one lock
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._cache_lock = threading.Lock()
 
     def check_rate_limit(
         self,
@@ -28,29 +40,27 @@ class SimpleRateLimiter:
     ) -> RateLimitResult:
         """Simple rate limiting check"""
         try:
-            now = datetime.utcnow()
+            now = time.monotonic()
             limit_key = f"{key}:{identifier}"
 
-            # Clean old entries
-            if limit_key in self._counters:
-                self._counters[limit_key] = [
-                    timestamp for timestamp in self._counters[limit_key]
-                    if timestamp > now - timedelta(minutes=window_minutes)
-                ]
-            else:
-                self._counters[limit_key] = []
+            # Token bucket: `limit` tokens, refilled evenly over the window
+            capacity = float(limit)
+            refill_rate = limit / (window_minutes * 60)
 
-            # Check if limit exceeded
-            if len(self._counters[limit_key]) >= limit:
-                # Calculate retry time
-                oldest_time = min(self._counters[limit_key])
-                retry_time = oldest_time + timedelta(minutes=window_minutes)
-                retry_after = max(0, int((retry_time - now).total_seconds()))
-                return RateLimitResult(allowed=False, retry_after=retry_after)
+            with self._locks[hash(limit_key) & (_LOCK_STRIPES - 1)]:
+                with self._cache_lock:
+                    tokens, last_refill = self._counters.get(limit_key, (capacity, now))
+                tokens = min(capacity, tokens + (now - last_refill) * refill_rate)
 
-            # Add current request
-            self._counters[limit_key].append(now)
-            return RateLimitResult(allowed=True, retry_after=0)
+                # Check if limit exceeded
+                if tokens < 1:
+                    retry_after = math.ceil((1 - tokens) / refill_rate)
+                    return RateLimitResult(allowed=False, retry_after=retry_after)
+
+                # Take a token for the current request
+                with self._cache_lock:
+                    self._counters[limit_key] = (tokens - 1, now)
+                return RateLimitResult(allowed=True, retry_after=0)
 
         except Exception as e:
             logger.error(f"Rate limit check failed: {e}")
@@ -61,8 +71,9 @@ class SimpleRateLimiter:
         """Reset rate limit for a key"""
         try:
             limit_key = f"{key}:{identifier}"
-            if limit_key in self._counters:
-                del self._counters[limit_key]
+            with self._locks[hash(limit_key) & (_LOCK_STRIPES - 1)]:
+                with self._cache_lock:
+                    self._counters.pop(limit_key, None)
             return True
         except Exception as e:
             logger.error(f"Failed to reset rate limit: {e}")
@@ -1,5 +1,7 @@
+import functools
+import re
 import phonenumbers
-from phonenumbers import carrier, geocoder
+from phonenumbers import carrier, geocoder, NumberParseException
 import httpx
 import logging
 from typing import Optional, Dict, List
@@ -13,12 +15,33 @@ from app.services.email_service import email_service
 
 logger = logging.getLogger(__name__)
 
+# Shared connection pool for HTTP SMS providers (no per-send DNS/TLS handshake)
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+)
+
+# Backstop per provider attempt; above TextBelt's own 10s HTTP timeout and long
+# enough for an SMTP connect + STARTTLS + AUTH round
+_PROVIDER_TIMEOUT_SECONDS = 15.0
+
 class SMSProvider(str, Enum):
     EMAIL_TO_SMS = "email_to_sms"
     TWILIO_TRIAL = "twilio_trial"
     TEXTBELT = "textbelt"
     FALLBACK_EMAIL = "fallback_email"
 
+_NON_DIGITS_RE = re.compile(r'\D')
+
+@functools.lru_cache(maxsize=50_000)
+def _parse_phone(phone_number: str) -> Optional[phonenumbers.PhoneNumber]:
+    """
+    Parse a phone number once per input string, None if it cannot be parsed
+    """
+    try:
+        return phonenumbers.parse(phone_number, "US")
+    except NumberParseException:
+        return None
+
 class CarrierEmailGateways:
     """
     Email-to-SMS gateways for major carriers (completely free)
@@ -42,45 +65,44 @@ class CarrierEmailGateways:
         'telus': ['@msg.telus.com'],  # Canada
     }
 
-    @classmethod
-    def get_email_address(cls, phone_number: str, carrier_name: str = None) -> Optional[str]:
+    # Substring of the detected carrier name -> our gateway key
+    CARRIER_MAPPING = {
+        'verizon': 'verizon',
+        'at&t': 'att',
+        't-mobile': 'tmobile',
+        'sprint': 'sprint',
+        'boost': 'boost',
+        'cricket': 'cricket'
+    }
+
+    @staticmethod
+    @functools.lru_cache(maxsize=10_000)
+    def get_email_address(phone_number: str, carrier_name: str = None) -> Optional[str]:
         """
         Convert phone number to email address for SMS gateway
+        Results are cached per (phone_number, carrier_name)
         """
-        try:
-            # Clean phone number
-            phone_digits = ''.join(filter(str.isdigit, phone_number))
-
-            if carrier_name and carrier_name.lower() in cls.GATEWAYS:
-                gateway = cls.GATEWAYS[carrier_name.lower()][0]
-                return f"{phone_digits}{gateway}"
-
-            # Try to detect carrier automatically
-            parsed_number = phonenumbers.parse(phone_number, "US")
-            if phonenumbers.is_valid_number(parsed_number):
-                carrier_name = carrier.name_for_number(parsed_number, "en")
-
-                # Map carrier names to our gateways
-                carrier_mapping = {
-                    'verizon': 'verizon',
-                    'at&t': 'att',
-                    't-mobile': 'tmobile',
-                    'sprint': 'sprint',
-                    'boost': 'boost',
-                    'cricket': 'cricket'
-                }
-
-                for key, value in carrier_mapping.items():
-                    if key in carrier_name.lower():
-                        gateway = cls.GATEWAYS[value][0]
-                        return f"{phone_digits}{gateway}"
-
-            # Default to Verizon (most common)
-            return f"{phone_digits}@vtext.com"
+        gateways = CarrierEmailGateways.GATEWAYS
+        # Clean phone number
+        phone_digits = _NON_DIGITS_RE.sub('', phone_number)
 
-        except Exception as e:
-            logger.error(f"Failed to convert phone to email: {e}")
-            return None
+        if carrier_name and carrier_name.lower() in gateways:
+            gateway = gateways[carrier_name.lower()][0]
+            return f"{phone_digits}{gateway}"
+
+        # Try to detect carrier automatically
+        parsed_number = _parse_phone(phone_number)
+        if parsed_number is not None and phonenumbers.is_valid_number(parsed_number):
+            carrier_name = carrier.name_for_number(parsed_number, "en").lower()
+
+            # Map carrier names to our gateways
+            for key, value in CarrierEmailGateways.CARRIER_MAPPING.items():
+                if key in carrier_name:
+                    gateway = gateways[value][0]
+                    return f"{phone_digits}{gateway}"
+
+        # Default to Verizon (most common)
+        return f"{phone_digits}@vtext.com"
 
 class SMSService:
     """
@@ -90,12 +112,22 @@ class SMSService:
 
     def __init__(self):
         self.providers = self._initialize_providers()
+        # One client for the process so HTTP keep-alive and TLS sessions are reused
+        self._twilio_client = None
+        if self.providers[SMSProvider.TWILIO_TRIAL]:
+            self._twilio_client = TwilioClient(
+                settings.TWILIO_ACCOUNT_SID,
+                settings.TWILIO_AUTH_TOKEN
+            )
         self.provider_order = [
             SMSProvider.EMAIL_TO_SMS,      # Free forever
             SMSProvider.TWILIO_TRIAL,      # Free trial credits
             SMSProvider.TEXTBELT,          # Free but limited
             SMSProvider.FALLBACK_EMAIL,    # Last resort
         ]
+        self._enabled_providers = tuple(
+            p for p in self.provider_order if self.providers.get(p, False)
+        )
 
     def _initialize_providers(self) -> Dict[SMSProvider, bool]:
         """
@@ -134,26 +166,36 @@ class SMSService:
             logger.error(f"Invalid phone number: {phone_number}")
             return False
 
-        # Try each provider in order
-        for provider in self.provider_order:
-            if not self.providers.get(provider, False):
-                continue
-
-            try:
-                success = await self._send_via_provider(
-                    provider, phone_number, message, carrier
-                )
-                if success:
-                    logger.info(f"SMS sent via {provider.value} to {phone_number}")
-                    return True
-
-            except Exception as e:
-                logger.warning(f"Provider {provider.value} failed: {e}")
-                continue
+        # Try each enabled provider in order; sends can't be undone, so never in parallel
+        for provider in self._enabled_providers:
+            if await self._try_provider(provider, phone_number, message, carrier):
+                logger.info(f"SMS sent via {provider.value} to {phone_number}")
+                return True
 
         logger.error(f"All SMS providers failed for {phone_number}")
         return False
 
+    async def _try_provider(
+        self,
+        provider: SMSProvider,
+        phone_number: str,
+        message: str,
+        carrier: Optional[str] = None
+    ) -> bool:
+        """
+        Send via one provider within the per-provider time budget
+        """
+        try:
+            return await asyncio.wait_for(
+                self._send_via_provider(provider, phone_number, message, carrier),
+                timeout=_PROVIDER_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Provider {provider.value} timed out")
+        except Exception as e:
+            logger.warning(f"Provider {provider.value} failed: {e}")
+        return False
+
     async def _send_via_provider(
         self,
         provider: SMSProvider,
@@ -189,22 +231,11 @@ class SMSService:
             if not email_address:
                 return False
 
-            # Create simple HTML for SMS
-            html_content = f"""
-            <html>
-            <body style="font-family: Arial, sans-serif;">
-                <div style="background: #f8f9fa; padding: 20px; border-radius: 8px;">
-                    <h3 style="color: #495057; margin: 0 0 15px 0;">🔐 PortfolioRisk</h3>
-                    <p style="margin: 0; font-size: 16px; color: #212529;">{message}</p>
-                </div>
-            </body>
-            </html>
-            """
-
+            # Gateways strip HTML, so send the message as plain text only
             return await email_service.send_email_async(
                 to_email=email_address,
                 subject="PortfolioRisk Security Code",
-                html_content=html_content,
+                html_content=None,
                 text_content=message
             )
 
@@ -217,15 +248,12 @@ class SMSService:
         Send SMS via Twilio (free trial credits)
         """
         try:
-            if not hasattr(settings, 'TWILIO_ACCOUNT_SID'):
+            if not self._twilio_client:
                 return False
 
-            client = TwilioClient(
-                settings.TWILIO_ACCOUNT_SID,
-                settings.TWILIO_AUTH_TOKEN
-            )
-
-            message = client.messages.create(
+            # The Twilio client is blocking; keep it off the event loop
+            message = await asyncio.to_thread(
+                self._twilio_client.messages.create,
                 body=message,
                 from_=settings.TWILIO_PHONE_NUMBER,
                 to=phone_number
@@ -245,22 +273,21 @@ class SMSService:
         Send SMS via TextBelt (1 free per day per IP)
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    'https://textbelt.com/text',
-                    data={
-                        'phone': phone_number,
-                        'message': message,
-                        'key': 'textbelt'  # Free tier key
-                    },
-                    timeout=10.0
-                )
-
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get('success', False)
+            response = await _http_client.post(
+                'https://textbelt.com/text',
+                data={
+                    'phone': phone_number,
+                    'message': message,
+                    'key': 'textbelt'  # Free tier key
+                },
+                timeout=10.0
+            )
 
-                return False
+            if response.status_code == 200:
+                result = response.json()
+                return result.get('success', False)
+
+            return False
 
         except Exception as e:
             logger.error(f"TextBelt SMS failed: {e}")
@@ -281,36 +308,39 @@ class SMSService:
             logger.error(f"Fallback email failed: {e}")
             return False
 
+    async def aclose(self) -> None:
+        """
+        Close the shared HTTP connection pool (call on application shutdown)
+        """
+        await _http_client.aclose()
+
     def _validate_phone_number(self, phone_number: str) -> bool:
         """
         Validate phone number format
         """
-        try:
-            parsed_number = phonenumbers.parse(phone_number, "US")
-            return phonenumbers.is_valid_number(parsed_number)
-        except:
+        if not phone_number or len(phone_number) < 7 or len(phone_number) > 20:
             return False
 
+        parsed_number = _parse_phone(phone_number)
+        return parsed_number is not None and phonenumbers.is_valid_number(parsed_number)
+
     def get_phone_info(self, phone_number: str) -> Dict[str, str]:
         """
         Get information about phone number (carrier, location)
         Useful for choosing the right SMS gateway
         """
-        try:
-            parsed_number = phonenumbers.parse(phone_number, "US")
-
-            if phonenumbers.is_valid_number(parsed_number):
-                carrier_name = carrier.name_for_number(parsed_number, "en")
-                location = geocoder.description_for_number(parsed_number, "en")
-
-                return {
-                    'carrier': carrier_name,
-                    'location': location,
-                    'country_code': str(parsed_number.country_code),
-                    'is_valid': True
-                }
-        except Exception as e:
-            logger.error(f"Failed to get phone info: {e}")
+        parsed_number = _parse_phone(phone_number)
+
+        if parsed_number is not None and phonenumbers.is_valid_number(parsed_number):
+            carrier_name = carrier.name_for_number(parsed_number, "en")
+            location = geocoder.description_for_number(parsed_number, "en")
+
+            return {
+                'carrier': carrier_name,
+                'location': location,
+                'country_code': str(parsed_number.country_code),
+                'is_valid': True
+            }
 
         return {
             'carrier': 'Unknown',
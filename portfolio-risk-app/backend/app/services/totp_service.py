@@ -1,18 +1,72 @@
 import pyotp
-import qrcode
+import functools
 import io
 import base64
 import secrets
-import json
-from typing import Optional, List, Tuple
+import hmac
+import hashlib
+import struct
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional, List, Tuple
 import logging
-from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
 
 from app.core.config import settings
 
+# qrcode and Pillow are imported on first QR render; verify-only workers never load them
+if TYPE_CHECKING:
+    from PIL import Image
+
 logger = logging.getLogger(__name__)
 
+# Dedicated pepper so rotating the JWT signing key doesn't invalidate backup codes
+_BACKUP_CODE_KEY = settings.BACKUP_CODE_PEPPER.encode()
+
+# Stand-ins so accounts without 2FA data do the same work as real ones
+_DUMMY_TOTP_KEY = bytes(20)
+_DUMMY_BACKUP_HASH = "0" * 64
+
+def _hash_backup_code(code: str) -> str:
+    """
+    Keyed SHA-256 of a backup code; the codes carry 32 random bits so no KDF is needed
+    """
+    return hmac.new(_BACKUP_CODE_KEY, code.encode(), hashlib.sha256).hexdigest()
+
+@functools.lru_cache(maxsize=4096)
+def _totp_key(secret: str) -> bytes:
+    """
+    Raw HMAC key for a base32 TOTP secret (padding optional, case-insensitive)
+    """
+    return base64.b32decode(secret + '=' * (-len(secret) % 8), casefold=True)
+
+def _totp_at(keyed_mac: hmac.HMAC, counter: int, digits: int = 6) -> str:
+    """
+    RFC 4226 HOTP value for a counter (RFC 6238 uses counter = unix time // interval)
+    keyed_mac is an HMAC already keyed with the secret; it is copied, not consumed
+    """
+    mac = keyed_mac.copy()
+    mac.update(struct.pack(">Q", counter))
+    digest = mac.digest()
+    # Dynamic truncation: 31 bits starting at the offset in the low nibble
+    offset = digest[-1] & 0x0F
+    code = (int.from_bytes(digest[offset:offset + 4], 'big') & 0x7FFFFFFF) % 10 ** digits
+    return f"{code:0{digits}d}"
+
+@functools.lru_cache(maxsize=16)
+def _brand_tile(diameter: int) -> "Image.Image":
+    """
+    RGBA tile of the QR branding: a blue circle inside a 2px white ring
+    """
+    from PIL import Image, ImageDraw
+
+    size = diameter + 5
+    tile = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    # White circle background
+    draw.ellipse([0, 0, size - 1, size - 1], fill="white")
+    # Blue circle
+    draw.ellipse([2, 2, diameter + 2, diameter + 2], fill="#1e40af")
+    return tile
+
 class TOTPService:
     """
     Time-based One-Time Password service
@@ -23,6 +77,8 @@ class TOTPService:
         self.issuer_name = "PortfolioRisk"
         self.digits = 6
         self.interval = 30  # 30-second intervals (standard)
+        # SHA-1 is what enrolled authenticators use and the only one all of them honour
+        self.digest = hashlib.sha1
 
     def generate_secret(self) -> str:
         """
@@ -39,7 +95,7 @@ class TOTPService:
         """
         Generate provisioning URI for QR code
         """
-        totp = pyotp.TOTP(secret)
+        totp = pyotp.TOTP(secret, digest=self.digest)
 
         account_name = user_name or user_email
 
@@ -52,7 +108,8 @@ class TOTPService:
         self,
         user_email: str,
         secret: str,
-        user_name: Optional[str] = None
+        user_name: Optional[str] = None,
+        branding: bool = False
     ) -> str:
         """
         Generate QR code as base64 string for easy frontend display
@@ -61,40 +118,55 @@ class TOTPService:
             provisioning_uri = self.generate_provisioning_uri(
                 user_email, secret, user_name
             )
+            return self._render_qr(provisioning_uri, branding)
 
-            # Create QR code with custom styling
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
+        except Exception as e:
+            logger.error(f"Failed to generate QR code: {e}")
+            return None
+
+    @staticmethod
+    def _render_qr(provisioning_uri: str, branding: bool = False) -> str:
+        """
+        Render a provisioning URI to a PNG data URI
+        Plain QR codes are written straight to PNG; Pillow is only used for branding
+        """
+        import qrcode
+        import qrcode.image.pure
+
+        # Create QR code with custom styling
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=10,
+            border=4,
+        )
 
-            qr.add_data(provisioning_uri)
-            qr.make(fit=True)
+        qr.add_data(provisioning_uri)
+        qr.make(fit=True)
 
+        buffer = io.BytesIO()
+        if branding:
             # Create QR code image with custom colors
             img = qr.make_image(
                 fill_color="#1e40af",  # Primary blue
                 back_color="white"
             )
 
-            # Add logo/branding to center (optional)
-            img = self._add_branding_to_qr(img)
+            # Add logo/branding to center
+            img = TOTPService._add_branding_to_qr(img)
+            # QR images deflate well even at the fastest level
+            img.save(buffer, format='PNG', optimize=False, compress_level=1)
+        else:
+            # 1-bit greyscale PNG rendered from the module matrix
+            img = qr.make_image(image_factory=qrcode.image.pure.PyPNGImage)
+            img.save(buffer)
 
-            # Convert to base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-
-            qr_base64 = base64.b64encode(buffer.getvalue()).decode()
-            return f"data:image/png;base64,{qr_base64}"
-
-        except Exception as e:
-            logger.error(f"Failed to generate QR code: {e}")
-            return None
+        # Convert to base64 straight from the buffer, without copying the PNG bytes
+        qr_base64 = base64.b64encode(buffer.getbuffer()).decode('ascii')
+        return f"data:image/png;base64,{qr_base64}"
 
-    def _add_branding_to_qr(self, qr_img: Image.Image) -> Image.Image:
+    @staticmethod
+    def _add_branding_to_qr(qr_img: "Image.Image") -> "Image.Image":
         """
         Add subtle branding to QR code center
         """
@@ -106,17 +178,10 @@ class TOTPService:
             # Create small logo area (about 10% of QR size)
             logo_size = min(width, height) // 10
 
-            # Draw simple circle logo
-            draw = ImageDraw.Draw(qr_img)
-            left = center_x - logo_size // 2
-            top = center_y - logo_size // 2
-            right = center_x + logo_size // 2
-            bottom = center_y + logo_size // 2
-
-            # White circle background
-            draw.ellipse([left-2, top-2, right+2, bottom+2], fill="white")
-            # Blue circle
-            draw.ellipse([left, top, right, bottom], fill="#1e40af")
+            # Paste the pre-rendered circle logo, white ring included
+            tile = _brand_tile(logo_size // 2 * 2)
+            offset = tile.width // 2
+            qr_img.paste(tile, (center_x - offset, center_y - offset), tile)
 
             return qr_img
 
@@ -128,10 +193,20 @@ class TOTPService:
         """
         Verify TOTP token
         window: number of time periods to check (allows for clock drift)
+        A missing secret runs the same checks against a dummy key and fails
         """
         try:
-            totp = pyotp.TOTP(secret)
-            return totp.verify(token, valid_window=window)
+            # Key the HMAC once; each step in the window reuses the expanded key
+            key = _totp_key(secret) if secret else _DUMMY_TOTP_KEY
+            keyed_mac = hmac.new(key, None, self.digest)
+            counter = int(time.time()) // self.interval
+            token = str(token)
+
+            # Check every step in the window so timing doesn't reveal which one matched
+            matched = False
+            for step in range(counter - window, counter + window + 1):
+                matched |= hmac.compare_digest(_totp_at(keyed_mac, step, self.digits), token)
+            return matched and bool(secret)
         except Exception as e:
             logger.error(f"TOTP verification failed: {e}")
             return False
@@ -141,7 +216,7 @@ class TOTPService:
         Get current token (for testing purposes)
         """
         try:
-            totp = pyotp.TOTP(secret)
+            totp = pyotp.TOTP(secret, digest=self.digest)
             return totp.now()
         except Exception as e:
             logger.error(f"Failed to get current token: {e}")
@@ -151,8 +226,7 @@ class TOTPService:
         """
         Get seconds remaining until next token change
         """
-        import time
-        return self.interval - int(time.time()) % self.interval
+        return self.interval - (time.time_ns() // 1_000_000_000) % self.interval
 
 class BackupCodesService:
     """
@@ -167,13 +241,12 @@ class BackupCodesService:
         """
         Generate backup codes for account recovery
         """
+        # One draw from the OS RNG, 32 bits per readable code (4-4 format)
+        bits = secrets.randbits(32 * self.num_codes)
         codes = []
         for _ in range(self.num_codes):
-            # Generate readable codes (4-4 format)
-            part1 = secrets.token_hex(2).upper()
-            part2 = secrets.token_hex(2).upper()
-            code = f"{part1}-{part2}"
-            codes.append(code)
+            codes.append(f"{(bits >> 16) & 0xFFFF:04X}-{bits & 0xFFFF:04X}")
+            bits >>= 32
 
         return codes
 
@@ -181,19 +254,34 @@ class BackupCodesService:
         """
         Hash backup codes for secure storage
         """
-        from app.core.security import get_password_hash
-        return [get_password_hash(code) for code in codes]
+        return [_hash_backup_code(code) for code in codes]
 
     def verify_backup_code(self, code: str, hashed_codes: List[str]) -> bool:
         """
         Verify backup code against hashed codes
+        Every stored hash is compared so timing doesn't reveal which one matched
         """
-        from app.core.security import verify_password
+        # The XXXX-XXXX format is public, so rejecting other shapes early leaks nothing
+        if len(code) != 9 or code[4] != '-':
+            return False
+        code = code.upper()
+
+        candidate = _hash_backup_code(code)
+        matched = False
+
+        if not hashed_codes:
+            # Same hash-and-compare as a real check, so no codes looks like wrong code
+            hmac.compare_digest(candidate, _DUMMY_BACKUP_HASH)
+            return False
 
         for hashed_code in hashed_codes:
-            if verify_password(code, hashed_code):
-                return True
-        return False
+            if hashed_code.startswith('$2'):
+                # bcrypt hashes stored before keyed hashing was introduced
+                from app.core.security import verify_password
+                matched |= verify_password(code, hashed_code)
+            else:
+                matched |= hmac.compare_digest(candidate, hashed_code)
+        return matched
 
     def format_codes_for_display(self, codes: List[str]) -> str:
         """
@@ -210,9 +298,13 @@ class TwoFactorAuthService:
     Complete 2FA service combining TOTP and backup codes
     """
 
-    def __init__(self):
-        self.totp_service = TOTPService()
-        self.backup_service = BackupCodesService()
+    def __init__(
+        self,
+        totp_service: Optional[TOTPService] = None,
+        backup_service: Optional[BackupCodesService] = None
+    ):
+        self.totp_service = totp_service or TOTPService()
+        self.backup_service = backup_service or BackupCodesService()
 
     def setup_2fa_for_user(
         self,
@@ -264,7 +356,7 @@ class TwoFactorAuthService:
             return True, "totp"
 
         # If TOTP fails, try backup codes
-        if backup_codes and self.backup_service.verify_backup_code(token, backup_codes):
+        if self.backup_service.verify_backup_code(token, backup_codes or []):
             return True, "backup_code"
 
         return False, "none"
@@ -273,19 +365,26 @@ class TwoFactorAuthService:
         """
         Get current 2FA status and time remaining
         """
-        return {
+        status = {
             'time_remaining': self.totp_service.get_time_remaining(),
-            'current_token': self.totp_service.get_current_token(secret),  # Only for testing
             'is_setup': bool(secret)
         }
+        if settings.ENVIRONMENT == "test":
+            # Never expose a live code outside the test environment
+            status['current_token'] = self.totp_service.get_current_token(secret)
+        return status
 
 class AuthMethodManager:
     """
     Manage multiple authentication methods for a user
     """
 
-    def __init__(self):
-        self.tfa_service = TwoFactorAuthService()
+    def __init__(self, tfa_service: Optional[TwoFactorAuthService] = None):
+        self.tfa_service = tfa_service or TwoFactorAuthService()
+        # method_type -> (setup, verify, status); register new methods here
+        self._handlers: Dict[str, Tuple[Callable, Callable, Callable]] = {
+            "totp": (self._setup_totp, self._verify_totp, self._totp_status),
+        }
 
     def create_auth_method_data(
         self,
@@ -297,11 +396,8 @@ class AuthMethodManager:
         """
         Create auth method data based on type
         """
-        if method_type == "totp":
-            return self.tfa_service.setup_2fa_for_user(user_email, user_name)
-
-        # Add other method types here (hardware keys, etc.)
-        return {}
+        handlers = self._handlers.get(method_type)
+        return handlers[0](user_email, user_name) if handlers else {}
 
     def verify_auth_method(
         self,
@@ -312,28 +408,37 @@ class AuthMethodManager:
         """
         Verify authentication method
         """
-        if method_type == "totp":
-            secret = method_data.get('secret')
-            backup_codes = method_data.get('hashed_backup_codes', [])
-            return self.tfa_service.verify_2fa_token(
-                secret, provided_token, backup_codes
-            )
-
-        return False, "unsupported_method"
+        handlers = self._handlers.get(method_type)
+        if not handlers:
+            return False, "unsupported_method"
+        return handlers[1](method_data, provided_token)
 
     def get_method_status(self, method_type: str, method_data: dict) -> dict:
         """
         Get status for authentication method
         """
-        if method_type == "totp":
-            secret = method_data.get('secret')
-            if secret:
-                return self.tfa_service.get_2fa_status(secret)
+        handlers = self._handlers.get(method_type)
+        return handlers[2](method_data) if handlers else {'is_setup': False}
+
+    def _setup_totp(self, user_email: str, user_name: Optional[str] = None) -> dict:
+        return self.tfa_service.setup_2fa_for_user(user_email, user_name)
+
+    def _verify_totp(self, method_data: dict, provided_token: str) -> Tuple[bool, str]:
+        secret = method_data.get('secret')
+        backup_codes = method_data.get('hashed_backup_codes', [])
+        return self.tfa_service.verify_2fa_token(
+            secret, provided_token, backup_codes
+        )
 
+    def _totp_status(self, method_data: dict) -> dict:
+        secret = method_data.get('secret')
+        if secret:
+            return self.tfa_service.get_2fa_status(secret)
         return {'is_setup': False}
 
 # Singleton instances
 totp_service = TOTPService()
 backup_codes_service = BackupCodesService()
-two_factor_auth_service = TwoFactorAuthService()
-auth_method_manager = AuthMethodManager()
\ No newline at end of file
+# Shared down the chain so every path hits the same per-secret caches
+two_factor_auth_service = TwoFactorAuthService(totp_service, backup_codes_service)
+auth_method_manager = AuthMethodManager(two_factor_auth_service)
\ No newline at end of file